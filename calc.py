@@ -1,220 +1,202 @@
-from typing import List, Tuple, Iterator, Union, Callable
+from typing import List, Tuple, Union, Sequence
 import enum
+import functools
+import operator
+import re
+import sys
 
 import dataclasses
 
 
-class Token_Kind(enum.Enum):
-    INT = enum.auto(),
-    FLOAT = enum.auto(),
-    STRING = enum.auto(),
-    PLUS = enum.auto(),
-    MINUS = enum.auto(),
-    ASTERISK = enum.auto(),
-    SLASH = enum.auto(),
-    LPAREN = enum.auto(),
-    RPAREN = enum.auto(),
-    FUNC = enum.auto(),
-    COMMA = enum.auto(),
+class Token_Kind(enum.IntEnum):
+    INT = enum.auto()
+    FLOAT = enum.auto()
+    STRING = enum.auto()
+    PLUS = enum.auto()
+    MINUS = enum.auto()
+    ASTERISK = enum.auto()
+    SLASH = enum.auto()
+    LPAREN = enum.auto()
+    RPAREN = enum.auto()
+    FUNC = enum.auto()
+    COMMA = enum.auto()
 
+    # print as 'Token_Kind.INT' rather than as the bare int.
+    __str__ = enum.Enum.__str__
+    __format__ = enum.Enum.__format__
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True, frozen=True)
 class Token:
     kind: Token_Kind
-    value: Union[int, str]
+    value: Union[int, float, str]
 
-    def __str__(self):
+    def __str__(self) -> str:
         return f"Token(kind={self.kind:20}, value={self.value})"
 
 
-def match_sequence_in_range(s: str, rs: Iterator[Iterator]) -> Tuple[str, str]:
-    out = ""
-    while s and any(ord(s[0]) in r for r in rs):
-        c, s = s[:1], s[1:]
-        out += c
-    return out, s
-
-
-def match_range(s: str, rs: Iterator[Iterator]):
-    c = ""
-    if s and any(ord(s[0]) in r for r in rs):
-        c, s = s[:1], s[1:]
-    return c, s
+class Invalid_Expression(Exception):
+    pass
 
 
-def match_digits(s: str)-> Tuple[str,str]:
-    DIGITS = [range(ord("0"), ord("9")+1)]
-    return match_sequence_in_range(s, DIGITS)
-
-def match_float(s:str) -> Tuple[str,str]:
-    start = s
-    flt_int, s = match_digits(s)
-    if not flt_int:
-        return "", start
-    
-    if not (s and s[0] == "."):
-        return "",start
-
-    _, s = s[:1], s[1:]
-
-    flt_frac, s = match_digits(s) # this can be empty, as in '1.'
-
-    flt_str = f"{flt_int}.{flt_frac}"
-    return flt_str, s
-
+# tokens of the operators and separators that are exactly one character long.
+# their value is fully determined by their kind, so one shared instance is reused.
+SINGLE_CHAR_TOKENS = {
+    c: Token(kind, c) for c, kind in [
+        ("+", Token_Kind.PLUS),
+        ("-", Token_Kind.MINUS),
+        ("*", Token_Kind.ASTERISK),
+        ("/", Token_Kind.SLASH),
+        ("(", Token_Kind.LPAREN),
+        (")", Token_Kind.RPAREN),
+        (",", Token_Kind.COMMA),
+    ]
+}
 
-def match_whitespace(s: str):
-    WHITES = [[ord(c) for c in [" ", "\t"]]]
-    return match_sequence_in_range(s, WHITES)
+OPCODE_PUSH = 0
+OPCODE_ADD = 1
+OPCODE_SUB = 2
+OPCODE_MUL = 3
+OPCODE_DIV = 4
+OPCODE_SQ = 5
+OPCODE_IF = 6
+OPCODE_TYPE = 7
+
+# number of stack values each opcode consumes.
+OPCODE_ARITY = {
+    OPCODE_PUSH: 0,
+    OPCODE_ADD: 2,
+    OPCODE_SUB: 2,
+    OPCODE_MUL: 2,
+    OPCODE_DIV: 2,
+    OPCODE_SQ: 1,
+    OPCODE_IF: 3,
+    OPCODE_TYPE: 1,
+}
 
-def match_escape_sequence(s:str):
-    start = s
-    if not (s and s[0] == "\\"):
-        return "",start
-    _, s = s[:1], s[1:]
-    c, s = s[:1], s[1:]
-    if c == "\\":
-        return "\\",s
-    elif c == "n":
-        return "\n",s
-    elif c == "t":
-        return "\t",s
-    elif c =="\"":
-        return "\""
-    elif c == "\'":
-        return "\'"
-    else:
-        assert False, f"undefined escape sequence: '\{c}'"
+# the functions of the language, by name. their argument counts follow from OPCODE_ARITY.
+FUNC_OPCODES = {
+    "sq": OPCODE_SQ,
+    "if": OPCODE_IF,
+    "type": OPCODE_TYPE,
+}
 
+# number of arguments each function expects.
+FUNC_OPCOUNT = {func: OPCODE_ARITY[op] for func, op in FUNC_OPCODES.items()}
+
+# function tokens are fully determined by their name too.
+FUNC_TOKENS = {func: Token(Token_Kind.FUNC, func) for func in FUNC_OPCODES}
+
+# one alternative per token class, tried in order. tokenize skips leading whitespace
+# once, after that every alternative consumes the whitespace that follows its token.
+TOKEN_SINGLE_CHAR = 1
+TOKEN_STRING = 2
+TOKEN_FUNC = 3
+TOKEN_NUMBER = 4
+TOKEN_PATTERN = re.compile(
+    r"(?:"
+    r"([" + re.escape("".join(SINGLE_CHAR_TOKENS)) + r"])"
+    r"|(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*')"
+    r"|([A-Za-z]+)"
+    r"|([0-9]+(?:\.[0-9]*)?)" # the fraction can be empty, as in '1.'
+    r")[ \t]*"
+)
+
+
+ESCAPE_SEQUENCES = {
+    "\\": "\\",
+    "n": "\n",
+    "t": "\t",
+    "\"": "\"",
+    "\'": "\'",
+}
 
-def match_string(s:str):
-    str_seps = ["\"", "'"]
 
-    start = s
-    if not (s and s[0] in str_seps):
-        return None,start
+def match_escape_sequence(s: str, i: int) -> Tuple[str, int]:
+    if not (i < len(s) and s[i] == "\\"):
+        return "", i
+    c = s[i+1:i+2]
+    esc = ESCAPE_SEQUENCES.get(c)
+    if esc is None:
+        print(f"Undefined escape sequence: '\\{c}'")
+        raise Invalid_Expression(s)
+    return esc, i+2
 
-    str_sep,s = s[:1], s[1:]
 
-    str_text = ""
+def unescape_string(s: str) -> str:
+    # copy the runs between escape sequences as whole slices.
+    parts = []
+    i = 0
     while True:
-        if len(s) == 0:
-            return None,start
-        elif s[0] == str_sep:
-            _,s = s[:1], s[1:]
-            return str_text,s
-        elif s[0] == "\\":
-            esc,s = match_escape_sequence(s)
-            str_text += esc
-            continue
-        else:
-            c,s = s[:1], s[1:]
-            str_text += c
+        j = s.find("\\", i)
+        if j == -1:
+            parts.append(s[i:])
+            return "".join(parts)
+        parts.append(s[i:j])
+        esc, i = match_escape_sequence(s, j)
+        parts.append(esc)
 
 
-def match_funcs(s: str):
-    FUNCS = ["sq", "if","type"]
-    s_low = s.lower()
-    for func in FUNCS:
-        if s_low.startswith(func):
-            func_len = len(func)
-            return s[:func_len], s[func_len:]
-    return "", s
+def unknown_sequence(s: str, i: int) -> Invalid_Expression:
+    print(
+        f"Unknown sequence at row {i}:\n"
+        f"{s}\n"
+        f"{' '*i}^"
+    )
+    return Invalid_Expression(s)
 
 
 def tokenize(s: str) -> List[Token]:
-    assert s, "Empty Input"
-    start = s
-    tokens = []
-    while s:
-        if s[0] == "+":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.PLUS, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == "-":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.MINUS, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == "*":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.ASTERISK, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == "/":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.SLASH, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == "(":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.LPAREN, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == ")":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.RPAREN, c))
-            _, s = match_whitespace(s)
-            continue
-        elif s[0] == ",":
-            c, s = s[:1], s[1:]
-            tokens.append(Token(Token_Kind.COMMA, c))
-            _, s = match_whitespace(s)
-
-        str_str, s = match_string(s)
-        if str_str is not None:
-            tokens.append(Token(Token_Kind.STRING,str_str))
-            _,s = match_whitespace(s)
-            continue
-
-        fun_str, s = match_funcs(s)
-        if fun_str:
-            tokens.append(Token(Token_Kind.FUNC, fun_str))
-            _, s = match_whitespace(s)
-            continue
-
-        flt_str, s = match_float(s)
-        if flt_str:
-            tokens.append(Token(Token_Kind.FLOAT, float(flt_str)))
-            _, s = match_whitespace(s)
-            continue
-
-        int_str, s = match_digits(s)
-        if int_str:
-            tokens.append(Token(Token_Kind.INT, int(int_str)))
-            _, s = match_whitespace(s)
-            continue
-
-        err_pos = len(start) - len(s)
-        raise NotImplementedError(
-            f"Unknown sequence at row {err_pos}:\n"
-            f"{start}\n"
-            f"{' '*err_pos}^"
-        )
+    if not s:
+        print("Empty input")
+        raise Invalid_Expression(s)
+    i = len(s) - len(s.lstrip(" \t"))
+    n = len(s)
+    tokens: List[Token] = []
+    depth = 0
+    # bound once, these are called for every token.
+    match_token = TOKEN_PATTERN.match
+    append = tokens.append
+    while i < n:
+        m = match_token(s, i)
+        if m is None:
+            raise unknown_sequence(s, i)
+
+        group = m.lastindex
+        assert group is not None # every alternative is a capturing group
+        text = m.group(group)
+        if group == TOKEN_SINGLE_CHAR:
+            token = SINGLE_CHAR_TOKENS[text]
+            if token.kind is Token_Kind.LPAREN:
+                depth += 1
+            elif token.kind is Token_Kind.RPAREN:
+                depth -= 1
+                if depth < 0:
+                    print("Unmatched right parenthesis")
+                    raise Invalid_Expression(s)
+            append(token)
+        elif group == TOKEN_STRING:
+            append(Token(Token_Kind.STRING, unescape_string(text[1:-1])))
+        elif group == TOKEN_FUNC:
+            # names are matched as whole identifiers in any case, then looked up in lower case.
+            func_token = FUNC_TOKENS.get(text.lower())
+            if func_token is None:
+                raise unknown_sequence(s, i)
+            append(func_token)
+        elif "." in text: # TOKEN_NUMBER
+            append(Token(Token_Kind.FLOAT, float(text)))
+        else:
+            append(Token(Token_Kind.INT, int(text)))
+        i = m.end()
 
+    if depth != 0:
+        print("Unmatched left parenthesis")
+        raise Invalid_Expression(s)
     return tokens
 
 
-def validate(tokens: List[Token]):
+def validate(tokens: List[Token]) -> bool:
 
-    def validate_scopes(tokens: List[Token])->bool:
-        depth = 0
-        for token in tokens:
-            if token.kind == Token_Kind.LPAREN:
-                depth += 1
-            elif token.kind == Token_Kind.RPAREN:
-                depth -= 1
-            
-            if depth < 0:
-                print("Unmatched right parenthesis")
-                return False
-        
-        if depth != 0:
-            print("Unmatched left parenthesis")
-            return False
-        return True
-    
     def validate_grammar(tokens:List[Token])->bool:
         # grammar in this case refers to the order of literals <lit> and operators <op>.
 
@@ -226,17 +208,17 @@ def validate(tokens: List[Token]):
         for i,kind in enumerate(kinds):
             if kind in LIT_KINDS:
                 structure.append(GRAMMAR_LIT)
-            elif kind == Token_Kind.FUNC:
-                if not i+1 < len(kinds) or kinds[i+1] != Token_Kind.LPAREN:
+            elif kind is Token_Kind.FUNC:
+                if not i+1 < len(kinds) or kinds[i+1] is not Token_Kind.LPAREN:
                     print(f"Function '{tokens[i].value}' does not have an argument list.")
                     return False
                 structure.append(GRAMMAR_LIT)
                 structure.append(GRAMMAR_OP)
-            elif kind == Token_Kind.LPAREN:   # '(' -> <lit>, <op> maintains the grammar structure
+            elif kind is Token_Kind.LPAREN:   # '(' -> <lit>, <op> maintains the grammar structure
                 structure.append(GRAMMAR_LIT)
                 structure.append(GRAMMAR_OP)
-            elif kind == Token_Kind.RPAREN:   # ')' ->  <op>, <lit> maintains the grammar structure
-                if i-2 >= 0 and kinds[i-2:i] == [Token_Kind.FUNC, Token_Kind.LPAREN]:
+            elif kind is Token_Kind.RPAREN:   # ')' ->  <op>, <lit> maintains the grammar structure
+                if i-2 >= 0 and kinds[i-2] is Token_Kind.FUNC and kinds[i-1] is Token_Kind.LPAREN:
                     # handle edge case 'f()'
                     structure.append(GRAMMAR_LIT)
                 structure.append(GRAMMAR_OP)
@@ -259,33 +241,28 @@ def validate(tokens: List[Token]):
                 return False
         return True
     
-    def validate_functions(tokens:List[Token]):
-
-        FUNC_OPCOUNT = {
-            "sq":1,
-            "if":3,
-            "type":1,
-        }
-        def match_scope(tokens:List[Token]):
-            if not (tokens and tokens[0].kind == Token_Kind.LPAREN):
+    def validate_functions(tokens:List[Token])->bool:
+
+        def match_scope(tokens:List[Token])->Tuple[List[Token],List[Token]]:
+            if not (tokens and tokens[0].kind is Token_Kind.LPAREN):
                 return [],tokens
 
             depth = 1
              
             for i,token in enumerate(tokens[1:]):
-                if token.kind == Token_Kind.LPAREN:
+                if token.kind is Token_Kind.LPAREN:
                     depth += 1
-                elif token.kind == Token_Kind.RPAREN:
+                elif token.kind is Token_Kind.RPAREN:
                     depth -= 1
                 
                 if depth == 0:
                     return tokens[:i+2],tokens[i+2:]
             return [], tokens
 
-        def split_exprlist(tokens:List[Token]):
+        def split_exprlist(tokens:List[Token])->List[List[Token]]:
             lp, *exprl, rp = tokens
-            assert lp.kind == Token_Kind.LPAREN
-            assert rp.kind == Token_Kind.RPAREN
+            assert lp.kind is Token_Kind.LPAREN
+            assert rp.kind is Token_Kind.RPAREN
             if len(exprl) == 0:
                 return []
             
@@ -293,13 +270,13 @@ def validate(tokens: List[Token]):
             expr = list()
             depth = 0
             for token in exprl:
-                if token.kind == Token_Kind.LPAREN:
+                if token.kind is Token_Kind.LPAREN:
                     depth += 1
                     expr.append(token)
-                elif token.kind == Token_Kind.RPAREN:
+                elif token.kind is Token_Kind.RPAREN:
                     depth -= 1
                     expr.append(token)
-                elif token.kind == Token_Kind.COMMA:
+                elif token.kind is Token_Kind.COMMA:
                     if depth == 0:
                         exprs.append(expr)
                         expr = list()
@@ -313,27 +290,32 @@ def validate(tokens: List[Token]):
         
         while tokens:
             token = tokens[0]
-            if token.kind == Token_Kind.FUNC:
+            if token.kind is Token_Kind.FUNC:
                 func, *tokens = tokens
                 exprl, tokens = match_scope(tokens)
                 exprs = split_exprlist(exprl)
-                if not FUNC_OPCOUNT[func.value] == len(exprs):
-                    plural = "argument" if FUNC_OPCOUNT[func.value] == 1 else "arguments"
-                    print(f"'{func.value}' expects {FUNC_OPCOUNT[func.value]} {plural} but got {len(exprs)}")
+                opcount = FUNC_OPCOUNT[str(func.value)]
+                if not opcount == len(exprs):
+                    plural = "argument" if opcount == 1 else "arguments"
+                    print(f"'{func.value}' expects {opcount} {plural} but got {len(exprs)}")
                     return False
                                 
                 for expr in exprs:
                     valid_subexpr = validate_functions(expr)
                     if not valid_subexpr:
                         return False
+            elif token.kind is Token_Kind.COMMA:
+                # commas inside argument lists were consumed by split_exprlist above.
+                print("Comma outside of an argument list")
+                return False
             else:
                 _, *tokens = tokens
                 
         return True
 
 
+    # balanced parentheses are already checked by tokenize.
     tests=[
-        validate_scopes,
         validate_grammar,
         validate_functions,
     ]
@@ -344,23 +326,23 @@ def validate(tokens: List[Token]):
     return True
     
 
-LIT_KINDS = [
+LIT_KINDS = frozenset([
     Token_Kind.INT,
     Token_Kind.FLOAT,
     Token_Kind.STRING,
-]
-
-OP_PREC = {
-    Token_Kind.COMMA: 0, # TODO: compare this to precedence 4
-    Token_Kind.PLUS: 1,
-    Token_Kind.MINUS: 1,
-    Token_Kind.ASTERISK: 2,
-    Token_Kind.SLASH: 2,
-    Token_Kind.FUNC: 3,
-    Token_Kind.LPAREN: 4,
-}
-
-OP_KINDS = [
+])
+
+# precedence of the operator kinds, indexed by the kind itself.
+OP_PREC = bytearray(max(Token_Kind)+1)
+OP_PREC[Token_Kind.COMMA] = 0 # TODO: compare this to precedence 4
+OP_PREC[Token_Kind.PLUS] = 1
+OP_PREC[Token_Kind.MINUS] = 1
+OP_PREC[Token_Kind.ASTERISK] = 2
+OP_PREC[Token_Kind.SLASH] = 2
+OP_PREC[Token_Kind.FUNC] = 3
+OP_PREC[Token_Kind.LPAREN] = 4
+
+OP_KINDS = frozenset([
     Token_Kind.PLUS,
     Token_Kind.MINUS,
     Token_Kind.ASTERISK,
@@ -368,36 +350,45 @@ OP_KINDS = [
     Token_Kind.COMMA,
     Token_Kind.FUNC,
     Token_Kind.LPAREN,
-]
+])
+
+# operators that open a (sub)expression; lower precedence operators never pop past them.
+SCOPE_KINDS = frozenset([
+    Token_Kind.LPAREN,
+    Token_Kind.COMMA,
+])
 
 
 def parse(tokens: List[Token]) -> List[Token]:
     '''Translate infix notation to postfix notation.'''
 
-    def peek(stack):
-        assert stack, "Peek from empty stack."
-        return stack[-1]
-
-
     ops: List[Token] = []
     out: List[Token] = []
 
     for token in tokens:
-        if token.kind in LIT_KINDS:
+        kind = token.kind
+        if kind in LIT_KINDS:
             out.append(token)
-        elif token.kind in OP_KINDS:
-            while ops and peek(ops).kind not in [Token_Kind.LPAREN, Token_Kind.COMMA] and not OP_PREC[peek(ops).kind] < OP_PREC[token.kind]:
+        elif kind in OP_KINDS:
+            prec = OP_PREC[kind]
+            while ops:
+                top_kind = ops[-1].kind
+                if top_kind in SCOPE_KINDS or OP_PREC[top_kind] < prec:
+                    break
                 out.append(ops.pop())
             ops.append(token)
-        elif token.kind == Token_Kind.RPAREN:
-            while ops and peek(ops).kind != Token_Kind.LPAREN:
-                if peek(ops).kind == Token_Kind.COMMA:
+        elif kind is Token_Kind.RPAREN:
+            while ops:
+                top_kind = ops[-1].kind
+                if top_kind is Token_Kind.LPAREN:
+                    break
+                if top_kind is Token_Kind.COMMA:
                     _ = ops.pop()
                 else:
                     out.append(ops.pop())
-            if ops and peek(ops).kind == Token_Kind.FUNC:
+            if ops and ops[-1].kind is Token_Kind.FUNC:
                 out.append(ops.pop())
-            assert ops.pop().kind == Token_Kind.LPAREN
+            _ = ops.pop() # the matching '(', tokenize guarantees it exists
         else:
             raise NotImplementedError(f"Unparsable token: {token}")
 
@@ -406,86 +397,163 @@ def parse(tokens: List[Token]) -> List[Token]:
     return out
 
 
-def make_token(a:Union[int,float])-> Token:
-    # piggyback off of python's type system... for now.
-    if isinstance(a, int):
-        return Token(Token_Kind.INT,a)
-    elif isinstance(a, float):
-        return Token(Token_Kind.FLOAT,a)
-    else:
-        assert False, f"Unknown type '{type(a)}' of value '{a}'"
+Value = Union[int, float, str, Token_Kind]
+
+# the kind reported by 'type' for each python type that can live on the evaluation stack.
+VALUE_KINDS = {
+    int: Token_Kind.INT,
+    float: Token_Kind.FLOAT,
+    str: Token_Kind.STRING,
+    Token_Kind: Token_Kind.STRING, # the result of 'type' itself
+}
+
+# an (opcode, operand) pair. only OPCODE_PUSH has an operand, the others carry None.
+Instruction = Tuple[int, Union[Value, None]]
+
+OPERATOR_OPCODES = {
+    Token_Kind.PLUS: OPCODE_ADD,
+    Token_Kind.MINUS: OPCODE_SUB,
+    Token_Kind.ASTERISK: OPCODE_MUL,
+    Token_Kind.SLASH: OPCODE_DIV,
+}
+
+BINARY_OPERATORS = {
+    OPCODE_ADD: operator.add,
+    OPCODE_SUB: operator.sub,
+    OPCODE_MUL: operator.mul,
+    OPCODE_DIV: operator.truediv,
+}
+
+
+def reject_kinds(*operands: Value) -> None:
+    # kinds are ints only so that they can index tables, 'type' results are not numbers.
+    for a in operands:
+        if type(a) is Token_Kind:
+            raise TypeError(f"unsupported operand type: '{a}'")
+
+
+def square(a: Value) -> Value:
+    reject_kinds(a)
+    return a*a # type: ignore[operator] # strings fail at run time, like the binary operators
+
 
+def kind_of(a: Value) -> Token_Kind:
+    return VALUE_KINDS[type(a)]
 
-def evaluate(tokens: List[Token]):
-    stack: List[Token] = []
+
+UNARY_FUNCTIONS = {
+    OPCODE_SQ: square,
+    OPCODE_TYPE: kind_of,
+}
+
+
+def assemble(tokens: Sequence[Token]) -> List[Instruction]:
+    '''Translate a postfix program to bytecode.'''
+    code: List[Instruction] = []
     for token in tokens:
-        if token.kind in LIT_KINDS:
-            stack.append(token)
-        elif token.kind == Token_Kind.PLUS:
-            b = stack.pop().value
-            a = stack.pop().value
-            c = a+b
-            stack.append(make_token(c))
-        elif token.kind == Token_Kind.MINUS:
-            b = stack.pop().value
-            a = stack.pop().value
-            c = a-b
-            stack.append(make_token(c))
-        elif token.kind == Token_Kind.ASTERISK:
-            b = stack.pop().value
-            a = stack.pop().value
-            c = a*b
-            stack.append(make_token(c))
-        elif token.kind == Token_Kind.SLASH:
-            b = stack.pop().value
-            a = stack.pop().value
-            c = a/b    
-            stack.append(make_token(c))
-        elif token.kind == Token_Kind.FUNC:
-            if token.value == "sq":
-                assert not len(stack) < 1, "Not enough arguments for sq function"
-                a = stack.pop().value
-                b = a*a
-                stack.append(make_token(b))
-            elif token.value == "if":
-                assert not len(stack) < 3, "Not enough arguments for if function"
-                false_val = stack.pop().value
-                true_val = stack.pop().value
-                condition = stack.pop().value
-                if condition:
-                    stack.append(make_token(true_val))
-                else:
-                    stack.append(make_token(false_val))
-            elif token.value == "type":
-                assert not len(stack) < 1, "Not enough arguments for type function"
-                a = stack.pop().kind
-                stack.append(Token(Token_Kind.STRING,a))
-            else:
+        kind = token.kind
+        if kind in LIT_KINDS:
+            code.append((OPCODE_PUSH, token.value))
+        elif kind in OPERATOR_OPCODES:
+            code.append((OPERATOR_OPCODES[kind], None))
+        elif kind is Token_Kind.FUNC:
+            if token.value not in FUNC_OPCODES:
                 raise NotImplementedError(
                     f"Cannot evaluate unknown function: {token}")
+            code.append((FUNC_OPCODES[token.value], None))
         else:
             raise NotImplementedError(
                 f"Cannot evaluate unknown token: {token}")
-    assert len(stack) == 1
-    return stack.pop()
+    return code
+
+
+def execute(code: Sequence[Instruction]) -> Value:
+    # the stack holds bare values, never tokens. operators replace their left operand in place.
+    stack: List[Value] = []
+    for op, arg in code:
+        if op == OPCODE_PUSH:
+            stack.append(arg) # type: ignore[arg-type] # PUSH operands are never None
+            continue
+
+        binary_operator = BINARY_OPERATORS.get(op)
+        if binary_operator is not None:
+            b = stack.pop()
+            reject_kinds(stack[-1], b)
+            stack[-1] = binary_operator(stack[-1], b)
+            continue
+
+        unary_function = UNARY_FUNCTIONS.get(op)
+        if unary_function is not None:
+            stack[-1] = unary_function(stack[-1])
+        elif op == OPCODE_IF:
+            false_val = stack.pop()
+            true_val = stack.pop()
+            if stack[-1]:
+                stack[-1] = true_val
+            else:
+                stack[-1] = false_val
+        else:
+            raise NotImplementedError(
+                f"Cannot execute unknown opcode: {op}")
+    if len(stack) != 1:
+        # validate rejects the stray commas that cause this, as in '(1,2)'. checked here as well
+        # so bytecode that leaves extra values behind never yields a partial result.
+        print("Invalid syntax")
+        raise Invalid_Expression(code)
+    return stack[0]
 
 
-def calculate(s: str):
+def evaluate(tokens: Sequence[Token]) -> Value:
+    return execute(assemble(tokens))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(s: str) -> Tuple[Instruction, ...]:
+    '''Translate source code to bytecode, caching valid programs by source.'''
     tokens = tokenize(s)
-    if not validate(tokens): return None
-    instructions = parse(tokens)
-    result = evaluate(instructions)
-    return result.value
+    if not validate(tokens):
+        # raising keeps invalid input out of the cache, so its error is printed every time.
+        raise Invalid_Expression(s)
+    # the language has no inputs, so every valid program folds to the single PUSH of its result.
+    # one run of the interpreter computes it, errors like division by zero are not cached.
+    value = execute(assemble(parse(tokens)))
+    return ((OPCODE_PUSH, value),)
+
 
+def calculate(s: str) -> Union[Value, None]:
+    try:
+        code = compile_expression(s)
+    except Invalid_Expression:
+        return None
+    # compile_expression folds every valid program to the single PUSH of its result.
+    return code[0][1]
 
-def print_tokens(tokens:List[Token]):
+
+def print_tokens(tokens:List[Token]) -> None:
     print(" ".join(str(token.value) for token in tokens))
 
-def terminal():
+def terminal() -> None:
+    # piped input, e.g. 'py calc.py < expressions.txt', is read without prompts,
+    # so the output holds one result or error per expression.
+    interactive = sys.stdin.isatty()
+    prompt = "> " if interactive else ""
     while True:
-        r = calculate(input("> "))
-        if r is not None:
-            print(r)
+        try:
+            s = input(prompt)
+        except EOFError:
+            if interactive:
+                print()
+            return
+        if not s.strip():
+            continue
+        # invalid input is reported by calculate itself, only evaluation can fail here.
+        # ValueError covers printing an int with more digits than str() allows.
+        try:
+            r = calculate(s)
+            if r is not None:
+                print(r)
+        except (ArithmeticError, TypeError, ValueError) as e:
+            print(f"Error: {e}")
 
 if __name__ == "__main__":
     terminal()